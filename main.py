@@ -1,8 +1,6 @@
+import math
 import numpy as np
-import simpy
-import statistics as stat
-import pandas as pd
-from random import randint
+from numpy.random import default_rng
 
 # fixed variables
 HORIZON = 3*365  # days
@@ -18,6 +16,10 @@ LORRY_MALFUNCTION_DISTANCE = 10**5
 LORRY_MALFUNCTION_DISTANCE_STD = 2*10**4
 LORRY_REPAIR_COST = 5000
 LORRY_REPAIR_COST_STD = 2000
+NORMAL_BUFFER_SIZE = 4096  # standard normal samples drawn at once
+
+# a random number generator shared by all simulations
+_RNG = default_rng()
 
 # slower route
 SLOW_WAY_DISTANCE = 620  # km
@@ -53,6 +55,15 @@ class DriverSimulation:
     """
     Create a driver simulation
     """
+    __slots__ = ('driving_time', 'driving_time_std', 'distance', 'petrol_cost', 'petrol_usage', 'fine',
+                 'refueling_frequency', 'refueling_liter_range', '_refueling_lowest_amount',
+                 '_refueling_highest_amount', 'weight_limit', 'fine_frequency', 'fine_frequency_paid_by_driver',
+                 '_police_period', '_deterministic_cost_per_course', 'theft_probability', 'hourly_wage',
+                 'hourly_wage_std', '_norm_buffer', '_norm_position', 'total_cost', 'total_profit',
+                 'total_penalty_points', 'number_of_courses', 'fine_paid_number_of_courses',
+                 'total_distance_after_repair', '_courses_since_refueling', '_refueling_draws',
+                 '_penalty_points_draws', '_next_malfunction_distance')
+
     def __init__(self, driving_time, driving_time_std, distance, petrol_cost, petrol_usage, fine, refueling_frequency,
                  refueling_liter_range, weight_limit, fine_frequency, fine_frequency_paid_by_driver, theft_probability):
         self.driving_time = driving_time
@@ -63,18 +74,41 @@ class DriverSimulation:
         self.fine = fine
         self.refueling_frequency = refueling_frequency
         self.refueling_liter_range = refueling_liter_range
+        self._refueling_lowest_amount, self._refueling_highest_amount = refueling_liter_range
         self.weight_limit = weight_limit
         self.fine_frequency = fine_frequency
         self.fine_frequency_paid_by_driver = fine_frequency_paid_by_driver
+        # a driver pays a fine on courses which are multiples of both frequencies
+        if fine_frequency == 0 or fine_frequency_paid_by_driver == 0:
+            self._police_period = 0
+        else:
+            self._police_period = int(np.lcm(fine_frequency, fine_frequency_paid_by_driver))
+        # a route fine and petrol are the same on every course
+        self._deterministic_cost_per_course = fine + distance * petrol_usage * petrol_cost
         self.theft_probability = theft_probability
         self.hourly_wage = AVERAGE_HOURLY_WAGE
         self.hourly_wage_std = AVERAGE_HOURLY_WAGE_STD
-        self.total_cost = 0
-        self.total_profit = 0
+        self._norm_buffer = _RNG.standard_normal(NORMAL_BUFFER_SIZE)
+        self._norm_position = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Reset a state of a driver, so that the same instance can simulate a next driver
+
+        run_simulation assumes a fresh state, the constructor sets it up for a first driver, so reset has to be called
+        only before each next run of the same instance
+        """
+        self.total_cost = 0.0
+        self.total_profit = 0.0
         self.total_penalty_points = 0
         self.number_of_courses = 0
         self.fine_paid_number_of_courses = 0
         self.total_distance_after_repair = 0
+        self._courses_since_refueling = 0
+        self._refueling_draws = None
+        self._penalty_points_draws = None
+        self._next_malfunction_distance = self._next_norm(LORRY_MALFUNCTION_DISTANCE, LORRY_MALFUNCTION_DISTANCE_STD)
 
     def run_simulation(self):
         """
@@ -83,169 +117,155 @@ class DriverSimulation:
         :return: a total cost
         :rtype: float
         """
-        env = simpy.Environment()
-        env.process(self._simulation(env))
-        env.run(until=24 * HORIZON)
+        # every course takes the same simulated time, so the number of courses is known upfront,
+        # a course ending exactly at the horizon is both charged and counted
+        n_courses = math.ceil(24 * HORIZON / self.driving_time)
+
+        # fixed costs are the same on every course, so they are summed up in a closed form
+        self.total_cost += n_courses * self._deterministic_cost_per_course
+        # wages and loads do not depend on a state of a driver - draw them for all courses at once
+        self.total_cost += self._cost_wage(n_courses)
+        self.total_profit += self._calculate_profits(n_courses)
+
+        # refueled litres and penalty points are drawn upfront for the largest possible number of events
+        n_refuelings = n_courses // self.refueling_frequency
+        n_police_checks = n_courses // self._police_period if self._police_period != 0 else 0
+        self._refueling_draws = iter(_RNG.integers(self._refueling_lowest_amount,
+                                                   self._refueling_highest_amount + 1,
+                                                   size=n_refuelings).tolist())
+        self._penalty_points_draws = iter(_RNG.integers(1, 6, size=n_police_checks).tolist())
+
+        for _ in range(n_courses):
+            # calculate costs of events and a distance
+            self.total_cost += self._calculate_event_costs()
+            self.total_distance_after_repair += self.distance
+
+            self.number_of_courses += 1
+            self._courses_since_refueling += 1
         return self.total_cost, self.total_profit, self.number_of_courses
 
-    def _simulation(self, env):
+    def _calculate_profit_weight(self, n_courses):
         """
-        Run different steps of a simulation
+        Calculate load weights of n courses
 
-        :param env: simpy.Environment
-        :type env: simpy.core.Environment
-        :return: yield different timeouts
-        :rtype: env.timeout type
+        :param n_courses: a number of courses
+        :type n_courses: integer
+        :return: load weights
+        :rtype: numpy.ndarray
         """
-        while True:
-            # calculate costs, profits and a distance
-            self.total_cost += self._calculate_costs()
-            self.total_profit += self._calculate_profits()
-            self.total_distance_after_repair += self.distance
-            yield env.timeout(self.driving_time)
-
-            self.number_of_courses += 1
-    
-    def _calculate_profit_weight(self):
-        lorry_weight = np.random.normal(AVERAGE_LORRY_WEIGHT + AVERAGE_LOAD_WEIGHT, AVERAGE_LOAD_WEIGHT_STD)
-        if lorry_weight > self.weight_limit:
-            lorry_weight = self.weight_limit
+        lorry_weight = _RNG.normal(AVERAGE_LORRY_WEIGHT + AVERAGE_LOAD_WEIGHT, AVERAGE_LOAD_WEIGHT_STD, n_courses)
+        lorry_weight = np.minimum(lorry_weight, self.weight_limit)
         profit_weight = lorry_weight - AVERAGE_LORRY_WEIGHT
         return profit_weight
         
-    def _calculate_profits(self):
+    def _calculate_profits(self, n_courses):
         """
-        Calculate total profits
+        Calculate total profits of n courses
 
+        :param n_courses: a number of courses
+        :type n_courses: integer
         :return: a profit value
         :rtype: float
         """
-        profit_weight = self._calculate_profit_weight()
-        profit = profit_weight * PRICE_PER_KG
-        profit -= self._cost_load_theft()  # loss on a theft - has to be here to be coherent
+        profit_weight = self._calculate_profit_weight(n_courses)
+        profit = profit_weight.sum() * PRICE_PER_KG
+        profit -= self._cost_load_theft(n_courses)  # loss on a theft - has to be here to be coherent
         return profit
     
-    def _calculate_costs(self):
+    def _calculate_event_costs(self):
         """
-        Sum up a whole cost per one run
+        Sum up costs of events during one run: refueling, a police fine and a vehicle malfunction
 
         :return: a cost
         :rtype: float
         """
         cost = 0
-        cost += self._cost_route_fine()
-        cost += self._cost_petrol()
-        cost += self._cost_wage()
-        cost += self._cost_refueling()
-        cost += self._cost_caught_by_police()
-        cost += self._cost_vehicle_malfunction()
-        return cost
-
-    def _cost_route_fine(self):
-        """
-        Calculate a fine cost
-
-        :return: a fine cost
-        :rtype: integer
-        """
-        return self.fine
-
-    def _cost_petrol(self):
-        """
-        Calculate a petrol cost
 
-        :return: a petrol cost
-        :rtype: float
-        """
-        return self.distance * self.petrol_usage * self.petrol_cost
+        # refueling
+        if self._courses_since_refueling == self.refueling_frequency:
+            self._courses_since_refueling = 0
+            cost += next(self._refueling_draws) * self.petrol_cost
+
+        # caught by police - a fine and penalty points
+        courses = self.number_of_courses
+        if self._police_period != 0 and courses != 0 and courses % self._police_period == 0:
+            self.fine_paid_number_of_courses += 1
+            # inverse CDF of fines 100, 200, 500 with probabilities 0.25, 0.4, 0.35
+            u = _RNG.random()
+            cost += 100 if u < 0.25 else (200 if u < 0.65 else 500)
+            self.total_penalty_points += self._add_penalty_points()  # adding penalty points
+
+        # vehicle malfunction - a distance of a next malfunction is drawn after a repair
+        if self.total_distance_after_repair > self._next_malfunction_distance:
+            self.total_distance_after_repair = 0
+            self._next_malfunction_distance = self._next_norm(LORRY_MALFUNCTION_DISTANCE,
+                                                              LORRY_MALFUNCTION_DISTANCE_STD)
+            cost += self._next_norm(LORRY_REPAIR_COST, LORRY_REPAIR_COST_STD)
+        return cost
 
-    def _cost_wage(self):
+    def _cost_wage(self, n_courses):
         """
-        Calculate a wage cost
+        Calculate a wage cost of n courses
 
+        :param n_courses: a number of courses
+        :type n_courses: integer
         :return: a wage cost
         :rtype: float
         """
-        avg_drive_time = np.random.normal(self.driving_time, self.driving_time_std)
-        hourly_wage = np.random.normal(self.hourly_wage, self.hourly_wage_std)
-        total = avg_drive_time * hourly_wage
+        avg_drive_time = _RNG.normal(self.driving_time, self.driving_time_std, n_courses)
+        hourly_wage = _RNG.normal(self.hourly_wage, self.hourly_wage_std, n_courses)
+        total = (avg_drive_time * hourly_wage).sum()
         return total
 
-    def _cost_refueling(self):
+    def _cost_load_theft(self, n_courses):
         """
-        Calculate refueling costs during a course
+        Calculate a theft loss of n courses
 
-        :return: a refueling cost
-        :rtype: integer
-        """
-        if self.number_of_courses % self.refueling_frequency == 0 & self.number_of_courses != 0:
-            lowest_amount = self.refueling_liter_range[0]  # take a minimum value
-            highest_amount = self.refueling_liter_range[1]  # take a maximum value
-            refueled_petrol = randint(lowest_amount, highest_amount)
-            cost = refueled_petrol * self.petrol_cost
-            return cost
-        else:
-            return 0
-
-    def _cost_caught_by_police(self):
-        """
-        Calculate a cost and penalty points if a driver has been caught by police
-
-        :return: a fine value
-        :rtype: integer
+        :param n_courses: a number of courses
+        :type n_courses: integer
+        :return: a loss
+        :rtype: float
         """
-        if self.fine_frequency != 0:
-            if self.number_of_courses % self.fine_frequency == 0 and self.number_of_courses != 0:
-                if self.number_of_courses % self.fine_frequency_paid_by_driver == 0 and self.number_of_courses != 0:
-                    self.fine_paid_number_of_courses += 1
-                    fine_value = np.random.choice([100, 200, 500], p=[0.25, 0.4, 0.35])
-                    self.total_penalty_points += self._add_penalty_points()  # adding penalty points
-                    return fine_value
-                else:
-                    return 0
-            else:
-                return 0
-        else:
-            return 0
-
-    def _cost_vehicle_malfunction(self):
-        malfunction_distance = np.random.normal(LORRY_MALFUNCTION_DISTANCE, LORRY_MALFUNCTION_DISTANCE_STD)
-        if self.total_distance_after_repair > malfunction_distance:
-            repair_cost = np.random.normal(LORRY_REPAIR_COST, LORRY_REPAIR_COST_STD)
-            return repair_cost
-        else:
-            return 0
+        n_thefts = np.count_nonzero(_RNG.random(n_courses) < self.theft_probability)
+        cost = self._calculate_profit_weight(n_thefts).sum() * PRICE_PER_KG
+        return cost
 
-    def _cost_load_theft(self):
+    def _next_norm(self, mean, std):
         """
-        Calculate a theft loss
+        Take a next normal sample from a pre-drawn buffer, refill the buffer when it is exhausted
 
-        :return: a loss
-        :rtype: integer
+        :param mean: a mean of a distribution
+        :type mean: float
+        :param std: a standard deviation of a distribution
+        :type std: float
+        :return: a sample
+        :rtype: float
         """
-        theft_prob = self.theft_probability
-        theft = np.random.choice([0, 1], p=[1-theft_prob, theft_prob])
-        if theft == 1:
-            cost = self._calculate_profit_weight() * PRICE_PER_KG
-            return cost
-        else:
-            return 0
-
-    @staticmethod
-    def _add_penalty_points():
+        if self._norm_position == NORMAL_BUFFER_SIZE:
+            self._norm_buffer = _RNG.standard_normal(NORMAL_BUFFER_SIZE)
+            self._norm_position = 0
+        sample = mean + std * self._norm_buffer[self._norm_position]
+        self._norm_position += 1
+        return sample
+
+    def _add_penalty_points(self):
         """
         Calculate penalty points
 
         :return: a number of penalty points
         :rtype: integer
         """
-        return randint(1, 5)
+        return next(self._penalty_points_draws)
 
 
 class Simulate:
     """
     Run a simulation with N drivers
     """
+    __slots__ = ('driving_time', 'driving_time_std', 'distance', 'petrol_cost', 'petrol_usage', 'fine',
+                 'refueling_frequency', 'refueling_liter_range', 'weight_limit', 'fine_frequency',
+                 'fine_frequency_paid_by_driver', 'theft_probability', 'n_drivers')
+
     def __init__(self,  driving_time, driving_time_std, distance, petrol_cost, petrol_usage, fine, refueling_frequency,
                  refueling_liter_range, weight_limit, fine_frequency, fine_frequency_paid_by_driver, theft_probability,
                  n_drivers):
@@ -270,28 +290,29 @@ class Simulate:
         :return: total_cost, total_profit, number_of_courses
         :rtype: float, float, integer
         """
-        i = 1
         total_cost = 0
         total_profit = 0
         number_of_courses = 0
-        while i <= self.n_drivers:
-            inst = DriverSimulation(self.driving_time,
-                                    self.driving_time_std,
-                                    self.distance,
-                                    self.petrol_cost,
-                                    self.petrol_usage,
-                                    self.fine,
-                                    self.refueling_frequency,
-                                    self.refueling_liter_range,
-                                    self.weight_limit,
-                                    self.fine_frequency,
-                                    self.fine_frequency_paid_by_driver,
-                                    self.theft_probability)
+        # all drivers share the same configuration, so a single instance is reset between drivers
+        inst = DriverSimulation(self.driving_time,
+                                self.driving_time_std,
+                                self.distance,
+                                self.petrol_cost,
+                                self.petrol_usage,
+                                self.fine,
+                                self.refueling_frequency,
+                                self.refueling_liter_range,
+                                self.weight_limit,
+                                self.fine_frequency,
+                                self.fine_frequency_paid_by_driver,
+                                self.theft_probability)
+        for driver in range(self.n_drivers):
+            if driver != 0:
+                inst.reset()
             result = inst.run_simulation()
             total_cost += result[0]
             total_profit += result[1]
             number_of_courses += result[2]
-            i += 1
         return total_cost, total_profit, number_of_courses
 
 